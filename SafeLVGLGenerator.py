@@ -1,17 +1,233 @@
 import os
+import io
 import re
 import time
-import copy
+import pickle
+import hashlib
+import tempfile
 import logging
 import sys
 from pathlib import Path
 
-import pycparser as pyc
-
 if __name__ != "__main__":
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import c_func_parser as cfp
+import clang_func_parser
+
+# Matches `#define LVGL_VERSION_{MAJOR,MINOR,PATCH} x` in lvgl.h.
+_LVGL_VERSION_PATTERN = re.compile(
+    r"^[ \t]*\#define[ \t]+LVGL_VERSION_(?P<field>MAJOR|MINOR|PATCH)[ \t]+(?P<version>[0-9]+)"
+)
+
+# Matches the variables of header and source templates, e.g. `${date}`.
+_TEMPLATE_VARIABLE_PATTERN = re.compile(
+    r"\$\{(?P<name>contents_here|lvgl_version|filename|date|time)\}"
+)
+
+# Compiler options followed by a value, either joined (`-Idir`) or separated
+# (`-I dir`). Longer options go first since options are matched by prefix.
+_CPP_PATH_OPTIONS = ("-isystem", "-iquote", "-idirafter", "-I")
+_CPP_VALUE_OPTIONS = _CPP_PATH_OPTIONS + ("-include", "-D", "-U")
+
+# Matches the files of AST cache, i.e. `<SHA-256>.pickle`.
+_AST_CACHE_FILE_PATTERN = re.compile(r"^[0-9a-f]{64}\.pickle$")
+
+
+def _read_template(path : str) -> str:
+    """
+    # Description:
+        Read the whole template file and convert all line endings to CRLF.
+
+    # Parameters:
+        path: Path of template file.
+
+    # Returns:
+        Template in str.
+    """
+    template = Path(path).read_bytes().decode("utf-8")
+    if(not template):
+        return ""
+    template = template.replace("\r\n", "\n").replace("\r", "\n")
+    if(not template.endswith("\n")):
+        template += "\n"
+    return template.replace("\n", "\r\n")
+
+
+def _list_header_dirs(root : str) -> list:
+    """
+    # Description:
+        List all folders containing header files under root, in the same
+        top-down order as `os.walk`. Each folder is listed with a single
+        `os.scandir` call.
+
+    # Parameters:
+        root: Root folder.
+
+    # Returns:
+        List of folders in str.
+    """
+    header_dirs = []
+    pending = [root]
+    while pending:
+        parent = pending.pop()
+        subdirs = []
+        has_header = False
+        try:
+            with os.scandir(parent) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks = False):
+                        subdirs.append(entry.path)
+                    elif not has_header and entry.name.endswith(".h"):
+                        has_header = True
+        except OSError:
+            continue
+
+        if has_header:
+            header_dirs.append(str(Path(parent)))
+        pending.extend(reversed(subdirs))
+    return header_dirs
+
+
+def _gen_safe_func_decl(prefix : str, function : cfp.CFunc) -> str:
+    """
+    # Description:
+        Generate function declaration of safe lvgl api without semicolon.
+        The function is renamed temporarily instead of being copied.
+
+    # Parameters:
+        prefix: The prefix of safe lvgl api.
+        function: C function in `CFunc`.
+
+    # Returns:
+        Function declaration with safe lvgl prefix.
+    """
+    name = function.name
+    function.name = prefix + name
+    try:
+        return function.to_str(False)
+    finally:
+        function.name = name
+
+
+def _fill_func_template(template : str, 
+    func_decl : str, func_call : str, func_type : str) -> str:
+    """
+    # Description:
+        Fill function template with rendered strings of function.
+
+    # Parameters:
+        template: Function template.
+        func_decl: Function declaration of safe lvgl api without semicolon.
+        func_call: Function call with ret value.
+        func_type: Return type of function.
+
+    # Returns:
+        Generated function in str.
+    """
+    func = template.replace(r"${func_decl}", func_decl)
+    func = func.replace(r"${func_call}", func_call)
+    if(func_type != "void"):
+        func = func.replace(r"${func_ret}", "return ret;")
+    else:
+        func = func.replace(r"${func_ret}", "")
+    func = func.replace(r"${func_comms}", "") #TODO.
+    return func
+
+
+def _split_cpp_args(cpp_args : list) -> list:
+    """
+    # Description:
+        Split compiler arguments into options and their values, options in
+        `_CPP_VALUE_OPTIONS` are accepted in both the joined and the separated
+        forms.
+
+    # Parameters:
+        cpp_args: Arguments of c compiler.
+
+    # Returns:
+        List of `(option, value)`, value is None for other arguments.
+
+    # Raises:
+        ValueError: The value of an option is missing.
+    """
+    options = []
+    args = iter(cpp_args)
+    for arg in args:
+        option = next((o for o in _CPP_VALUE_OPTIONS if arg.startswith(o)), None)
+        if(option is None):
+            options.append((arg, None))
+            continue
+        value = arg[len(option):]
+        if(not value):
+            value = next(args, None)
+            if(value is None):
+                raise ValueError("Missing value of argument: {}".format(arg))
+        options.append((option, value))
+    return options
+
+
+def _pcpp_preprocess(path : str, cpp_args : list, 
+    logger : logging.Logger) -> str:
+    """
+    # Description:
+        Preprocess header file in the current process with pcpp, which avoids
+        spawning the c compiler. `-I`, `-isystem`, `-iquote`, `-idirafter`,
+        `-D`, `-U` and `-include` of cpp_args are applied in both the joined
+        (`-Idir`) and the separated (`-I dir`) forms. `-E` and `-nostdinc` are
+        no-ops for pcpp, any other argument is ignored with a warning.
+
+    # Parameters:
+        path: Path of header file.
+        cpp_args: Arguments of c compiler.
+        logger: Logger for ignored arguments.
+
+    # Returns:
+        Preprocessed source in str.
+
+    # Raises:
+        RuntimeError: pcpp is not installed or failed to preprocess.
+        ValueError: The value of an option is missing.
+    """
+    try:
+        from pcpp import Preprocessor
+    except ImportError as e:
+        raise RuntimeError("pcpp is not installed, install it or use a " + \
+            "c compiler as cpp_path.") from e
+
+    preprocessor = Preprocessor()
+    forced_includes = []
+    for option, value in _split_cpp_args(cpp_args):
+        if(value is None):
+            if(option not in ("-E", "-nostdinc")):
+                logger.warning("pcpp ignores argument: {}".format(option))
+        elif(option in _CPP_PATH_OPTIONS):
+            preprocessor.add_path(value)
+        elif(option == "-include"):
+            forced_includes.append(value)
+        elif(option == "-D"):
+            # Same as gcc: `-DFOO` is 1 and `-DFOO=` is empty.
+            name, sep, definition = value.partition("=")
+            preprocessor.define("{} {}".format(name, definition if sep else "1"))
+        else:
+            preprocessor.undef(value)
+
+    if(forced_includes):
+        # Include the header itself after the forced includes, so that its
+        # line markers stay correct.
+        source = "".join("#include \"{}\"\n".format(
+            os.path.abspath(include).replace("\\", "/")) \
+            for include in forced_includes + [ path ])
+    else:
+        with open(path, "r", encoding = "utf-8") as f:
+            source = f.read()
+    preprocessor.parse(source, path)
+    output = io.StringIO()
+    preprocessor.write(output)
+    if(preprocessor.return_code):
+        raise RuntimeError("pcpp failed to preprocess {}".format(path))
+    return output.getvalue()
+
 
 class SafeLVGLGenerator():
     def __init__(self, 
@@ -35,7 +251,11 @@ class SafeLVGLGenerator():
 
         # Configs of function generating:
         block_regex : list = [ r"^(_lv){1}" ], 
-        safe_lvgl_prefix : str = "safe_"
+        safe_lvgl_prefix : str = "safe_",
+
+        # Configs of parsing lvgl.h:
+        ast_cache_dir : str = None,
+        backend : str = "pycparser"
         ):
         '''
         # Description:
@@ -78,6 +298,15 @@ class SafeLVGLGenerator():
 
             safe_lvgl_prefix:
                 The prefix of the generated function name.
+
+            ast_cache_dir:
+                The folder used to cache the parsed functions of lvgl.h between
+                runs, defaults to `.ast-cache` under safe_lvgl_path.
+
+            backend:
+                Parser of lvgl.h, `pycparser` or `clang`. `clang` requires the
+                libclang python bindings and falls back to `pycparser` without
+                them.
         '''
         ############################## public  ##############################
         self.lvgl_version_major = 0
@@ -92,37 +321,48 @@ class SafeLVGLGenerator():
         self._fake_libc_path = fake_libc_path
         self._lvgl_path = lvgl_path
         self._safe_lvgl_path = safe_lvgl_path
-
-        # Init c_func_parser.
-        self._parser = cfp.Parser("safe_lvgl_generator")
+        if(ast_cache_dir is None):
+            ast_cache_dir = os.path.join(safe_lvgl_path, ".ast-cache")
+        self._ast_cache_dir = ast_cache_dir
+
+        # Init parser.
+        self._parser = None
+        if(backend == "clang"):
+            try:
+                self._parser = clang_func_parser.Parser("safe_lvgl_generator")
+            except ImportError:
+                self.logger.warning("libclang is not installed, " + \
+                    "fall back to pycparser.")
+                backend = "pycparser"
+        elif(backend != "pycparser"):
+            raise ValueError("Unknown backend: {}".format(backend))
+        if(self._parser is None):
+            self._parser = cfp.Parser("safe_lvgl_generator")
+        self._backend = backend
 
         # Block stragegies.
         self._blacklist_func_patterns = []
         for regex in block_regex:
             self._blacklist_func_patterns.append(re.compile(regex, re.X))
+        self._blacklist_func_union = self._gen_blacklist_func_union()
 
         # Safe LVGL prefix.
         self._safe_lvgl_prefix = safe_lvgl_prefix
 
-        # Template files.
-        self._template_header = template_header
-        self._template_source = template_source
+        # Load template files once, they are reused by every generation.
+        self._template_header = _read_template(template_header)
+        self._template_source = _read_template(template_source)
 
         # Load function template.
-        self._template_func_decl = ""
-        self._template_func_def  = ""
-        with open(template_func_decl) as f:
-            for line in f.readlines():
-                line = line.replace('\r','').replace('\n','') + "\r\n"
-                self._template_func_decl += line
-        with open(template_func_def) as f:
-            for line in f.readlines():
-                line = line.replace('\r','').replace('\n','') + "\r\n"
-                self._template_func_def += line
+        self._template_func_decl = _read_template(template_func_decl)
+        self._template_func_def  = _read_template(template_func_def)
 
         # Function list.
         self._func_list = []
 
+        # Rendered strings of each function, see `_gen_func_strs`.
+        self._func_str_cache = {}
+
 
     def _get_realpath(self, relative_path : str) -> str:
         return os.path.realpath(os.path.join(self._lvgl_path, relative_path))
@@ -130,55 +370,73 @@ class SafeLVGLGenerator():
     
     def add_blacklist_func_pattern(self, func_pattern : re.Pattern):
         self._blacklist_func_patterns.append(func_pattern)
+        self._blacklist_func_union = self._gen_blacklist_func_union()
 
     
     def list_blacklist_func_patterns(self) -> list:
         return self._blacklist_func_patterns
 
 
+    def _gen_blacklist_func_union(self) -> re.Pattern:
+        """
+        # Description:
+            Fuse all blacklist patterns into one alternation, so that a function
+            name is checked with a single match. Flags of each pattern are kept
+            as scoped inline flags.
+
+        # Returns:
+            The fused pattern, or None if the patterns cannot be fused.
+        """
+        if(not self._blacklist_func_patterns):
+            # Never matches.
+            return re.compile(r"(?!)")
+
+        scoped_flags = (("i", re.I), ("m", re.M), ("s", re.S), ("x", re.X))
+        alternatives = []
+        for pattern in self._blacklist_func_patterns:
+            flags = "".join(c for c, flag in scoped_flags if pattern.flags & flag)
+            if(flags):
+                alternatives.append("(?{}:{})".format(flags, pattern.pattern))
+            else:
+                alternatives.append("(?:{})".format(pattern.pattern))
+
+        try:
+            return re.compile("|".join(alternatives))
+        except re.error as e:
+            self.logger.debug("Cannot fuse blacklist patterns: {}".format(e))
+            return None
+
+
+    def _is_blacklisted_func(self, func_name : str) -> bool:
+        if(self._blacklist_func_union is not None):
+            return self._blacklist_func_union.match(func_name) is not None
+        return any(pattern.match(func_name) \
+            for pattern in self._blacklist_func_patterns)
+
+
     def get_lvgl_version(self) -> list:
         """
         # Get lvgl version.
         # Return: [major, minor, patch]
         """
-        self.lvgl_version_major = 0
-        self.lvgl_version_minor = 0
-        self.lvgl_version_patch = 0
         # Prase lvgl version.
         lvgl_h_path = os.path.join(self._lvgl_path, "lvgl.h")
 
-        # Regex and pattern.
-        major_regex = r"^(\#define){1}[ ]+(LVGL_VERSION_MAJOR){1}[ ]+(?P<major_version>[0-9]+)"
-        minor_regex = r"^(\#define){1}[ ]+(LVGL_VERSION_MINOR){1}[ ]+(?P<minor_version>[0-9]+)"
-        patch_regex = r"^(\#define){1}[ ]+(LVGL_VERSION_PATCH){1}[ ]+(?P<patch_version>[0-9]+)"
-
-        major_pattern = re.compile(major_regex, re.X)
-        minor_pattern = re.compile(minor_regex, re.X)
-        patch_pattern = re.compile(patch_regex, re.X)
-
+        versions = {}
         with open(lvgl_h_path, "r") as lvgl_h:
-            line = lvgl_h.readline()
-            while(line):
-                line = line.replace('\r','').replace('\n','')
-                # Match major version.
-                if(not self.lvgl_version_major):
-                    ret = major_pattern.match(line)
-                    if(ret is not None):
-                        self.lvgl_version_major = int(ret.group("major_version"))
-
-                # Match minor version.
-                if(not self.lvgl_version_minor):
-                    ret = minor_pattern.match(line)
-                    if(ret is not None):
-                        self.lvgl_version_minor = int(ret.group("minor_version"))
-
-                # Match patch version.
-                if(not self.lvgl_version_patch):
-                    ret = patch_pattern.match(line)
-                    if(ret is not None):
-                        self.lvgl_version_patch = int(ret.group("patch_version"))
-
-                line = lvgl_h.readline()
+            # The defines are near the top of lvgl.h, stop reading once all
+            # three are found.
+            for line in lvgl_h:
+                ret = _LVGL_VERSION_PATTERN.match(line)
+                if(ret is None):
+                    continue
+                versions.setdefault(ret.group("field"), int(ret.group("version")))
+                if(len(versions) == 3):
+                    break
+
+        self.lvgl_version_major = versions.get("MAJOR", 0)
+        self.lvgl_version_minor = versions.get("MINOR", 0)
+        self.lvgl_version_patch = versions.get("PATCH", 0)
 
         return [self.lvgl_version_major, self.lvgl_version_minor, \
             self.lvgl_version_patch]
@@ -189,87 +447,201 @@ class SafeLVGLGenerator():
             self.lvgl_version_patch)
 
 
-    def _gen_date(self) -> str:
-        return time.strftime("%Y/%m/%d", time.localtime())
+    def _gen_date(self, now : time.struct_time = None) -> str:
+        return time.strftime("%Y/%m/%d", now or time.localtime())
     
 
-    def _gen_time(self) -> str:
-        return time.strftime("%H:%M:%S", time.localtime())
+    def _gen_time(self, now : time.struct_time = None) -> str:
+        return time.strftime("%H:%M:%S", now or time.localtime())
+
+
+    def _gen_run_variables(self) -> dict:
+        """
+        # Description:
+            Generate the variables that stay the same during one generation.
+
+        # Returns:
+            Dict of `lvgl_version`, `date` and `time`.
+        """
+        # Use one timestamp, so date and time never straddle a second.
+        now = time.localtime()
+        return {
+            "lvgl_version" : self._gen_lvgl_version(),
+            "date" : self._gen_date(now),
+            "time" : self._gen_time(now)
+        }
 
 
     def _replace_variables(self, 
-        original : str, contents : str, filename : str) -> str:
-        original = original.replace(r"${contents_here}", contents)
-        original = original.replace(r"${lvgl_version}", self._gen_lvgl_version())
-        original = original.replace(r"${filename}", filename)
-        original = original.replace(r"${date}", self._gen_date())
-        original = original.replace(r"${time}", self._gen_time())
-        return original
+        original : str, contents : str, filename : str, 
+        run_variables : dict) -> str:
+        variables = dict(run_variables, filename = filename)
+
+        # Variables inside contents are replaced too, but `${contents_here}`
+        # is only expanded once.
+        variables["contents_here"] = _TEMPLATE_VARIABLE_PATTERN.sub(
+            lambda ret: variables.get(ret.group("name"), ret.group(0)), contents)
+        return _TEMPLATE_VARIABLE_PATTERN.sub(
+            lambda ret: variables[ret.group("name")], original)
 
 
     def _output_safe_lvgl_api(self):
+        run_variables = self._gen_run_variables()
+
         # Output source file.
-        source_file_content = ""
-        for func in self._func_list:
-            source_file_content += self._gen_func_def(func) + "\r\n\r\n"
+        func_defs = [self._gen_func_def(func) for func in self._func_list]
+        # The trailing "" terminates the last function as well, without
+        # concatenating every function with the separator first.
+        source_file_content = "\r\n\r\n".join(func_defs + [ "" ])
 
         # Write source.
-        template_source = open(self._template_source, "r")
-        output_source = open(
-            os.path.join(self._safe_lvgl_path, "safe_lvgl.c"), "wb+"
-        )
-
-        line = template_source.readline()
-        while line:
-            line = line.replace('\r','').replace('\n','') + "\r\n"
-            line = self._replace_variables(line, source_file_content, 
-                "safe_lvgl.c")
-            
-            output_source.write(bytes(line, encoding = 'utf-8'))
-            line = template_source.readline()
-        template_source.close()
-        output_source.close()
+        source = self._replace_variables(self._template_source,
+            source_file_content, "safe_lvgl.c", run_variables)
+        Path(self._safe_lvgl_path, "safe_lvgl.c").write_bytes(
+            source.encode("utf-8"))
         
         # Output header file.
-        header_file_content = ""
-        for func in self._func_list:
-            header_file_content += self._gen_func_decl(func) + "\r\n\r\n"
+        func_decls = [self._gen_func_decl(func) for func in self._func_list]
+        header_file_content = "\r\n\r\n".join(func_decls + [ "" ])
 
         # Write header.
-        template_header = open(self._template_header, "r")
-        output_header = open(
-            os.path.join(self._safe_lvgl_path, "safe_lvgl.h"), "wb+"
-        )
-
-        line = template_header.readline()
-        while line:
-            line = line.replace('\r','').replace('\n','') + "\r\n"
-            line = self._replace_variables(line, header_file_content, 
-                "safe_lvgl.h")
-            
-            output_header.write(bytes(line, encoding = 'utf-8'))
-            line = template_header.readline()
-        template_header.close()
-        output_header.close()
+        header = self._replace_variables(self._template_header,
+            header_file_content, "safe_lvgl.h", run_variables)
+        Path(self._safe_lvgl_path, "safe_lvgl.h").write_bytes(
+            header.encode("utf-8"))
+
+
+    def _gen_ast_cache_key(self, cpp_path : str, cpp_args : list) -> str:
+        """
+        # Description:
+            Generate the key of the AST cache, which is the SHA-256 of the
+            parser backend and its source, the preprocessor command line and
+            the state of every header file in the include folders and of every
+            forced include file.
+
+        # Parameters:
+            cpp_path: Path of c compiler.
+            cpp_args: Arguments of c compiler.
+
+        # Returns:
+            Key in hex str.
+        """
+        key = hashlib.sha256()
+        key.update(self._backend.encode("utf-8"))
+
+        # Parsed functions are pickled, so a changed parser invalidates them.
+        parser_file = sys.modules[type(self._parser).__module__].__file__
+        stat = os.stat(parser_file)
+        key.update("\0{}\0{}\0{}".format(parser_file, stat.st_mtime_ns, 
+            stat.st_size).encode("utf-8"))
+        key.update(b"\0" + cpp_path.encode("utf-8"))
+        for arg in cpp_args:
+            key.update(b"\0" + arg.encode("utf-8"))
+
+        # Headers may come from lvgl, fake_libc or additional include folders
+        # (e.g. lv_conf.h), so check all of them.
+        for option, value in _split_cpp_args(cpp_args):
+            if(option in _CPP_PATH_OPTIONS and os.path.isdir(value)):
+                header_paths = [ entry.path for entry in sorted(os.scandir(value),
+                    key = lambda e: e.name) \
+                    if entry.name.endswith(".h") and entry.is_file() ]
+            elif(option == "-include" and os.path.isfile(value)):
+                header_paths = [ value ]
+            else:
+                continue
+            for header_path in header_paths:
+                stat = os.stat(header_path)
+                key.update("\0{}\0{}\0{}".format(header_path, 
+                    stat.st_mtime_ns, stat.st_size).encode("utf-8"))
+        return key.hexdigest()
+
+
+    def _load_ast_cache(self, key : str) -> list:
+        cache_path = os.path.join(self._ast_cache_dir, key + ".pickle")
+        if(not os.path.isfile(cache_path)):
+            return None
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            self.logger.warning("Failed to load AST cache {}: {}".\
+                format(cache_path, e))
+            return None
+
+
+    def _save_ast_cache(self, key : str, func_list : list):
+        cache_path = os.path.join(self._ast_cache_dir, key + ".pickle")
+        tmp_path = cache_path + ".tmp"
+        try:
+            os.makedirs(self._ast_cache_dir, exist_ok = True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(func_list, f, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            self.logger.warning("Failed to save AST cache {}: {}".\
+                format(cache_path, e))
+            if(os.path.exists(tmp_path)):
+                os.remove(tmp_path)
+            return
+
+        # Every change of headers creates a new entry, only keep the current
+        # one.
+        for entry in os.scandir(self._ast_cache_dir):
+            if(entry.name != key + ".pickle" and \
+                _AST_CACHE_FILE_PATTERN.match(entry.name)):
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    self.logger.warning("Failed to remove AST cache {}: {}".\
+                        format(entry.path, e))
+
+
+    def _parse_lvgl_h(self, cpp_path : str, cpp_args : list) -> list:
+        lvgl_h_path = os.path.join(self._lvgl_path, "lvgl.h")
+        # libclang always preprocesses by itself.
+        if(cpp_path != "pcpp" or self._backend == "clang"):
+            return self._parser.parse_file(
+                path=lvgl_h_path,
+                use_cpp=True,
+                cpp_path=cpp_path,
+                cpp_args=cpp_args
+            )
+
+        # Preprocess in process, the parser only accepts files.
+        source = _pcpp_preprocess(lvgl_h_path, cpp_args, self.logger)
+        f = tempfile.NamedTemporaryFile("w", suffix = ".i", 
+            encoding = "utf-8", delete = False)
+        try:
+            with f:
+                f.write(source)
+            return self._parser.parse_file(path=f.name, use_cpp=False)
+        finally:
+            os.remove(f.name)
 
 
     def parse(self, 
-        cpp_path : str = "gcc", additional_cpp_args : list = []
+        cpp_path : str = "gcc", additional_cpp_args : list = [],
+        use_cache : bool = True
         ) -> int:
+        """
+        # Description:
+            Parse all functions in lvgl.h.
+
+        # Parameters:
+            cpp_path: Path of c compiler used for preprocessing, or `pcpp` to
+                preprocess in the current process with pcpp.
+            additional_cpp_args: Additional arguments of c compiler.
+            use_cache: Load and save parsed functions with the AST cache.
+
+        # Returns:
+            Count of functions.
+        """
         # Check lvgl version.
         if(not self.lvgl_version_major):
             self.get_lvgl_version()
 
         # List all folders containing header files.
-        lvgl_include_path = []
-        for parent, dirnames, filenames in os.walk(self._lvgl_path):
-            parent_path = Path(parent)
-            # Check if the folder contains header files.
-            for filename in filenames:
-                ext = os.path.splitext(filename)[1][1:]
-                if ext =="h":
-                    lvgl_include_path.append(str(parent_path))
-                    break
+        lvgl_include_path = _list_header_dirs(self._lvgl_path)
 
         # Generate include_args.
         include_args = []
@@ -292,13 +664,41 @@ class SafeLVGLGenerator():
             r'-I{}'.format(self._fake_libc_path)
             ] + include_args + additional_cpp_args
 
+        # Load parsed functions from cache.
+        func_list = None
+        if(use_cache):
+            cache_key = self._gen_ast_cache_key(cpp_path, cpp_args)
+            func_list = self._load_ast_cache(cache_key)
+            if(func_list is not None):
+                self.logger.info("Loaded parsed lvgl.h from AST cache.")
+
         # Parse interface header.
-        self._func_list = self._parser.parse_file(
-            path=os.path.join(self._lvgl_path, "lvgl.h"),
-            use_cpp=True,
-            cpp_path=cpp_path,
-            cpp_args=cpp_args
-        )
+        if(func_list is None):
+            func_list = self._parse_lvgl_h(cpp_path, cpp_args)
+            if(use_cache):
+                self._save_ast_cache(cache_key, func_list)
+
+        self._func_str_cache.clear()
+
+        # Drop blocked and duplicated functions once here, so they are never
+        # generated. The cache keeps the full list since the blacklist may
+        # change.
+        # The list returned by `list_blacklist_func_patterns` may have been
+        # modified in place, so fuse the patterns again.
+        self._blacklist_func_union = self._gen_blacklist_func_union()
+        self._func_list = []
+        func_names = set()
+        blocked_count = 0
+        for func in func_list:
+            if(func.name in func_names):
+                continue
+            func_names.add(func.name)
+            if(self._is_blacklisted_func(func.name)):
+                blocked_count += 1
+                continue
+            self._func_list.append(func)
+        self.logger.info("{} functions were blocked by blacklist.".\
+            format(blocked_count))
 
         function_count = len(self._func_list)
 
@@ -313,13 +713,31 @@ class SafeLVGLGenerator():
 
 
     def gen_safe_lvgl(self):
-        # Output source file.
-        source_file_content = ""
-        for func in self._func_list:
-            source_file_content += self._gen_func_def(func) + "\r\n\r\n"
         self._output_safe_lvgl_api()
 
 
+    def _gen_func_strs(self, function : cfp.CFunc) -> tuple:
+        """
+        # Description:
+            Render the strings of function used by both function templates,
+            each function is only rendered once.
+
+        # Parameters:
+            function: C function in `CFunc`.
+
+        # Returns:
+            (Safe lvgl declaration, function call).
+        """
+        # Keyed by id, the cached function keeps the id from being reused.
+        strs = self._func_str_cache.get(id(function))
+        if(strs is None or strs[0] is not function):
+            strs = (function, 
+                _gen_safe_func_decl(self._safe_lvgl_prefix, function),
+                function.gen_func_call())
+            self._func_str_cache[id(function)] = strs
+        return strs[1:]
+
+
     def _gen_func_def(self, function : cfp.CFunc) -> str: 
         """
         # Description:
@@ -331,42 +749,33 @@ class SafeLVGLGenerator():
         # Returns:
             Function definition of safe lvgl api.
         """
+        safe_func_decl, func_call = self._gen_func_strs(function)
         self.logger.debug("Generating function " + function.name + " defination:")
-        func_def = self._template_func_def
-
-        safe_func_decl = copy.deepcopy(function)
-        safe_func_decl.name = self._safe_lvgl_prefix + function.name
+        func_def = _fill_func_template(self._template_func_def, safe_func_decl, 
+            func_call, function.type)
 
-        func_def = func_def.replace(r"${func_decl}", safe_func_decl.to_str(False))
-        func_def = func_def.replace(r"${func_call}", function.gen_func_call())
-        if(function.type != "void"):
-            func_def = func_def.replace(r"${func_ret}", "return ret;")
-        else:
-            func_def = func_def.replace(r"${func_ret}", "")
-        func_def = func_def.replace(r"${func_comms}", "") #TODO.
-
-        self._replace_variables(func_def, "${contents_here}", "${filename}")
         self.logger.debug(func_def)
         return func_def
 
 
-    def _gen_func_decl(self, function : pyc.c_ast.Decl) -> str: 
-        # Generate function.
-        self.logger.debug("Generating function " + function.name + " declaration:")
-        func_decl = self._template_func_decl
+    def _gen_func_decl(self, function : cfp.CFunc) -> str: 
+        """
+        # Description:
+            Generate function declaration of safe lvgl api using CFunc.
 
-        safe_func_decl = copy.deepcopy(function)
-        safe_func_decl.name = self._safe_lvgl_prefix + function.name
+        # Parameters:
+            function: C function in `CFunc`.
 
-        func_decl = func_decl.replace(r"${func_decl}", safe_func_decl.to_str(False))
-        func_decl = func_decl.replace(r"${func_call}", function.gen_func_call())
-        if(function.type != "void"):
-            func_decl = func_decl.replace(r"${func_ret}", "return ret;")
-        else:
-            func_decl = func_decl.replace(r"${func_ret}", "")
-        func_decl = func_decl.replace(r"${func_comms}", "") #TODO.
+        # Returns:
+            Function declaration of safe lvgl api.
+        """
+        safe_func_decl, func_call = self._gen_func_strs(function)
+
+        # Generate function.
+        self.logger.debug("Generating function " + function.name + " declaration:")
+        func_decl = _fill_func_template(self._template_func_decl, safe_func_decl, 
+            func_call, function.type)
 
-        self._replace_variables(func_decl, "${contents_here}", "${filename}")
         self.logger.debug(func_decl)
         return func_decl
 
@@ -385,20 +794,28 @@ def main():
     parser.add_argument("--func_def",  type = str, default = "./func_def_template.c",  help = "Path of template function defination file.")
 
     parser.add_argument("--prefix", type = str, default = "safe_", help = "Prefix of safe_lvgl api.")
-    parser.add_argument("--block_regex", type = list, default = [], help = "Regex of functions to be blocked.")
+    parser.add_argument("--block_regex", type = str, nargs = "*", help = "Regexes of functions to be blocked, defaults to ^(_lv).")
 
-    parser.add_argument("--cpp_path", type = str, default = "gcc", help = "Path of c compiler.")
+    parser.add_argument("--cpp_path", type = str, default = "gcc", help = "Path of c compiler, or pcpp to preprocess in process.")
     parser.add_argument("--cpp_args", type = list, default = [], help = "Additional arguments of c compiler.")
+    parser.add_argument("--no_cache", action = "store_true", help = "Do not use the AST cache of lvgl.h.")
+    parser.add_argument("--backend", type = str, default = "pycparser", choices = ["pycparser", "clang"], help = "Parser of lvgl.h.")
 
     args = parser.parse_args()
 
+    # Keep the default blacklist of SafeLVGLGenerator unless it is given.
+    optional_args = {}
+    if(args.block_regex is not None):
+        optional_args["block_regex"] = args.block_regex
+
     # Generator.
     generator = SafeLVGLGenerator(
         lvgl_path=args.lvgl, safe_lvgl_path=args.output, 
         template_header=args.header, template_source=args.source,
         template_func_decl=args.func_decl, template_func_def=args.func_def,
-        block_regex=args.block_regex,
-        safe_lvgl_prefix=args.prefix
+        backend=args.backend,
+        safe_lvgl_prefix=args.prefix,
+        **optional_args
     )
 
     # Setup logger.
@@ -408,7 +825,7 @@ def main():
     generator.logger.addHandler(ch)
 
     # Generate safe_lvgl.
-    generator.parse(args.cpp_path, args.cpp_args)
+    generator.parse(args.cpp_path, args.cpp_args, use_cache = not args.no_cache)
     generator.gen_safe_lvgl()
 
 
@@ -0,0 +1,166 @@
+import re
+import logging
+
+# Matches the pointer part of an abstract declarator, e.g. `(*` or `(* const *`.
+_POINTER_DECLARATOR_PATTERN = re.compile(
+    r"\((?:\s*\*(?:\s*(?:const|volatile|restrict)\b)*)+\s*"
+)
+
+
+class ClangFunc():
+    # One instance per lvgl function, drop the per-instance __dict__.
+    __slots__ = ("name", "type", "params", "_params_str", "_args_str")
+
+    def __init__(self, name : str, type : str, params : list):
+        '''
+        # Description:
+            C function extracted by libclang, provides the same interface as
+            `cfp.CFunc` used by SafeLVGLGenerator.
+
+        # Parameters:
+            name: Function name.
+            type: Return type in str, e.g. `lv_obj_t *`.
+            params: List of `(type, name)` tuples in str.
+        '''
+        self.name = name
+        self.type = type
+        self.params = params
+
+        # Parameters never change after parsing, render them only once.
+        if(params):
+            self._params_str = ", ".join(_gen_param_decl(param_type, param_name) \
+                for param_type, param_name in params)
+        else:
+            self._params_str = "void"
+        self._args_str = ", ".join(param_name for _, param_name in params)
+
+
+    def to_str(self, with_body : bool = False) -> str:
+        """
+        # Description:
+            Generate function declaration without semicolon. Functions from
+            libclang never have bodies, so `with_body` is ignored.
+        """
+        # The declarator goes inside `(*)` for function pointer return types.
+        return _gen_param_decl(self.type, 
+            "{}({})".format(self.name, self._params_str))
+
+
+    def gen_func_call(self) -> str:
+        call = "{}({});".format(self.name, self._args_str)
+        if(self.type != "void"):
+            return "{} = {}".format(_gen_param_decl(self.type, "ret"), call)
+        return call
+
+
+def _gen_param_decl(type_str : str, name : str) -> str:
+    """
+    # Description:
+        Insert the parameter name into the type spelled by libclang. For
+        pointers to functions or arrays the name goes into the innermost
+        `(*...)` declarator.
+
+    # Example:
+        `void (*)(lv_event_t *)` with `cb` -> `void (*cb)(lv_event_t *)`
+        `void (**)(int)` with `pp` -> `void (**pp)(int)`
+        `void (*[])(int)` with `cbs` -> `void (*cbs[])(int)`
+        `void (*(*)(int))(char)` with `f` -> `void (*(*f)(int))(char)`
+        `void (*)(int)` with `f(int i)` -> `void (*f(int i))(int)`
+        `const char *[]` with `txts` -> `const char * txts[]`
+    """
+    index = type_str.find("(")
+    match = None
+    while(index >= 0):
+        next_match = _POINTER_DECLARATOR_PATTERN.match(type_str, index)
+        if(next_match is None):
+            break
+        match = next_match
+        index = match.end()
+    if(match is not None):
+        if(type_str[index - 1].isalnum()):
+            name = " " + name
+        return type_str[:index] + name + type_str[index:]
+
+    if(type_str.endswith("]")):
+        index = type_str.index("[")
+        return type_str[:index].rstrip() + " " + name + type_str[index:]
+    return type_str + " " + name
+
+
+class Parser():
+    def __init__(self, logger_name : str):
+        '''
+        # Description:
+            Function declaration extractor based on libclang, replaces the
+            preprocessing and pycparser passes of `cfp.Parser`.
+
+        # Raises:
+            ImportError: libclang python bindings or the libclang library are
+                not installed.
+        '''
+        import clang.cindex as cindex
+        try:
+            # Loads the shared library, which may be missing even if the
+            # bindings are installed.
+            cindex.conf.lib
+        except cindex.LibclangError as e:
+            raise ImportError(str(e))
+        self._cindex = cindex
+        self.logger = logging.getLogger(logger_name)
+
+
+    def parse_file(self, path : str, use_cpp : bool = True,
+        cpp_path : str = "gcc", cpp_args : list = []) -> list:
+        """
+        # Description:
+            Parse all function declarations in header file. The signature is
+            the same as `cfp.Parser.parse_file`, `use_cpp` and `cpp_path` are
+            ignored since libclang preprocesses the header by itself.
+
+        # Returns:
+            List of `ClangFunc`.
+
+        # Raises:
+            RuntimeError: libclang reported errors, e.g. a missing header.
+        """
+        cindex = self._cindex
+        # libclang only accepts compiling arguments. The fake libc typedefs
+        # `__builtin_va_list`, which is a builtin type of clang.
+        args = [ arg for arg in cpp_args if arg != "-E" ] + \
+            [ "-x", "c", "-D__builtin_va_list=__fake_builtin_va_list" ]
+        tu = cindex.Index.create().parse(path, args = args,
+            options = cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES)
+
+        # Never return a partial function list, it would be cached.
+        errors = []
+        for diagnostic in tu.diagnostics:
+            if(diagnostic.severity >= cindex.Diagnostic.Error):
+                errors.append(str(diagnostic))
+            else:
+                self.logger.debug("libclang: {}".format(diagnostic))
+        if(errors):
+            raise RuntimeError("libclang failed to parse {}:\n{}".format(
+                path, "\n".join(errors)))
+
+        func_list = []
+        func_names = set()
+        # Hoisted, the header expands to tens of thousands of top-level nodes.
+        function_decl = cindex.CursorKind.FUNCTION_DECL
+        for cursor in tu.cursor.get_children():
+            if(cursor.kind is not function_decl or cursor.spelling in func_names):
+                continue
+
+            # Variadic arguments cannot be forwarded.
+            if(cursor.type.is_function_variadic()):
+                self.logger.debug("Skip variadic function " + cursor.spelling)
+                continue
+
+            params = []
+            for index, arg in enumerate(cursor.get_arguments()):
+                params.append((arg.type.spelling, arg.spelling or "arg{}".format(index)))
+
+            func_names.add(cursor.spelling)
+            func_list.append(
+                ClangFunc(cursor.spelling, cursor.result_type.spelling, params)
+            )
+        return func_list